@@ -0,0 +1,257 @@
+import glob
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import duckdb
+from sqlalchemy import MetaData, Table, create_engine, select, types
+from langchain_community.utilities import SQLDatabase
+
+# --- 1. CONFIGURATION ---
+# ANALYTICS_MODE=on routes agent queries to a local DuckDB/Parquet copy of the core tables
+# instead of DATABASE_URL, so heavy aggregates never hit the OLTP database.
+ANALYTICS_MODE = os.getenv("ANALYTICS_MODE", "off").lower() in ("1", "true", "on", "yes")
+ANALYTICS_DIR = os.getenv("ANALYTICS_DIR", "analytics")
+ANALYTICS_SYNC_INTERVAL = int(os.getenv("ANALYTICS_SYNC_INTERVAL", "300"))  # Incremental sync (seconds)
+ANALYTICS_FULL_REFRESH_INTERVAL = int(os.getenv("ANALYTICS_FULL_REFRESH_INTERVAL", "86400"))  # Full snapshot
+
+# Table -> primary key. Incremental syncs pull rows with a key above the last one we mirrored.
+MIRROR_TABLES = {
+    "members": "member_id",
+    "accounts": "account_id",
+    "loans": "loan_id",
+}
+
+
+def _duckdb_type(sa_type):
+    """Maps a reflected SQLAlchemy column type to the DuckDB type used in Parquet."""
+    if isinstance(sa_type, types.Boolean):
+        return "BOOLEAN"
+    if isinstance(sa_type, types.Integer):
+        return "BIGINT"
+    if isinstance(sa_type, (types.Float, types.Numeric)):
+        return "DOUBLE"
+    if isinstance(sa_type, types.DateTime):
+        return "TIMESTAMPTZ" if sa_type.timezone else "TIMESTAMP"
+    if isinstance(sa_type, types.Date):
+        return "DATE"
+    return "VARCHAR"
+
+
+def _sql_path(path):
+    """Absolute path quoted for a DuckDB string literal (forward slashes work on Windows too)."""
+    return "'" + os.path.abspath(path).replace("\\", "/").replace("'", "''") + "'"
+
+
+class AnalyticsMirror:
+    """
+    Columnar copy of the core tables for analytical queries.
+    - Each table is a folder of Parquet files: one snapshot plus a part file per incremental sync.
+    - sync() appends new rows by primary key; sync(full=True) re-snapshots and compacts the folder
+      (catches updates/deletes).
+    - sync_state.json lists each table's files and is saved right after every write; files it
+      doesn't list (a write that crashed before its state was saved) are dropped on the next sync.
+    - A DuckDB catalog exposes each folder as a view for the SQL agents.
+    """
+
+    def __init__(self, source_uri, mirror_dir=ANALYTICS_DIR, tables=None, batch_size=50_000):
+        self.source = create_engine(source_uri)
+        self.mirror_dir = mirror_dir
+        self.tables = tables or MIRROR_TABLES
+        self.batch_size = batch_size
+        self.catalog_path = os.path.join(mirror_dir, "mirror.duckdb")
+        self.state_path = os.path.join(mirror_dir, "sync_state.json")
+
+        os.makedirs(mirror_dir, exist_ok=True)
+        self.state = self._load_state()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._scheduler = None
+        self._engine = None
+
+    # --- Sync ---
+    def sync(self, full=False):
+        """Brings every mirrored table up to date with the source database."""
+        with self._lock:
+            metadata = MetaData()
+            for name, pk in self.tables.items():
+                table = Table(name, metadata, autoload_with=self.source)
+                self._drop_unlisted_files(name)
+                table_full = (full or "files" not in self.state.get(name, {})
+                              or not self._table_ready(name))
+                self._sync_table(table, pk, table_full)
+        return self.freshness()
+
+    def _drop_unlisted_files(self, name):
+        """Deletes Parquet files the state doesn't know about, so their rows are synced again, not twice."""
+        listed = set(self.state.get(name, {}).get("files", []))
+        for path in glob.glob(self.parquet_glob(name)):
+            if os.path.basename(path) not in listed:
+                os.remove(path)
+
+    def _sync_table(self, table, pk, full):
+        state = self.state.get(table.name, {})
+        last_id = None if full else state.get("max_id")
+
+        query = select(table).order_by(table.c[pk])
+        if last_id is not None:
+            query = query.where(table.c[pk] > last_id)
+
+        columns = {c.name: _duckdb_type(c.type) for c in table.columns}
+        pk_index = list(columns).index(pk)
+        synced_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+        # Stream rows from the source into a JSON-lines staging file (keeps NULL apart from any
+        # text value), then let DuckDB convert it to Parquet
+        fd, staging_path = tempfile.mkstemp(suffix=".jsonl", dir=self.mirror_dir)
+        names = list(columns)
+        new_rows, max_id = 0, last_id
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as staging:
+                with self.source.connect() as conn:
+                    result = conn.execution_options(stream_results=True).execute(query)
+                    while batch := result.fetchmany(self.batch_size):
+                        staging.writelines(json.dumps(dict(zip(names, row)), default=str) + "\n" for row in batch)
+                        new_rows += len(batch)
+                        max_id = batch[-1][pk_index]
+
+            files = [] if full else list(state.get("files", []))
+            if full:
+                files.append(self._write_snapshot(table.name, columns, staging_path))
+            elif new_rows:
+                files.append(self._write_part(table.name, columns, staging_path))
+        finally:
+            os.remove(staging_path)
+
+        rows = new_rows if full else state.get("rows", 0) + new_rows
+        self.state[table.name] = {
+            "max_id": max_id,
+            "rows": rows,
+            "files": files,
+            "synced_at": synced_at,
+            "full_refresh_at": synced_at if full else state.get("full_refresh_at"),
+        }
+        # Saved per table: a later table failing must not roll back this one's max_id
+        self._save_state()
+        print(f"[ANALYTICS] {table.name}: {'snapshot' if full else 'incremental'} sync, {new_rows} rows")
+
+    def _write_part(self, name, columns, staging_path):
+        """Incremental sync: only the new rows are written, as an extra file in the table folder."""
+        file_name = f"part-{time.time_ns()}.parquet"
+        target = os.path.join(self.table_dir(name), file_name)
+        # Written under a non-.parquet name first so the view's glob never sees a partial file
+        self._copy_to_parquet(columns, staging_path, target + ".tmp")
+        os.replace(target + ".tmp", target)
+        return file_name
+
+    def _write_snapshot(self, name, columns, staging_path):
+        """Full refresh: a fresh single-file folder replaces the snapshot and all part files."""
+        table_dir = self.table_dir(name)
+        next_dir, old_dir = table_dir + ".next", table_dir + ".old"
+        for leftover in (next_dir, old_dir):
+            shutil.rmtree(leftover, ignore_errors=True)
+
+        os.makedirs(next_dir)
+        self._copy_to_parquet(columns, staging_path, os.path.join(next_dir, "snapshot.parquet"))
+        # Two renames: a query landing between them finds no files and fails once, rather than
+        # double counting by seeing old parts next to the new snapshot
+        if os.path.exists(table_dir):
+            os.rename(table_dir, old_dir)
+        os.rename(next_dir, table_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        return "snapshot.parquet"
+
+    @staticmethod
+    def _copy_to_parquet(columns, staging_path, target):
+        column_spec = ", ".join(f"'{col}': '{typ}'" for col, typ in columns.items())
+        staged = (f"SELECT * FROM read_json({_sql_path(staging_path)}, format='newline_delimited', "
+                  f"columns={{{column_spec}}})")
+        con = duckdb.connect()
+        try:
+            con.execute(f"COPY ({staged}) TO {_sql_path(target)} (FORMAT PARQUET)")
+        finally:
+            con.close()
+
+    # --- Query side ---
+    def table_dir(self, name):
+        return os.path.join(self.mirror_dir, name)
+
+    def parquet_glob(self, name):
+        return os.path.join(self.table_dir(name), "*.parquet")
+
+    def _table_ready(self, name):
+        return bool(glob.glob(self.parquet_glob(name)))
+
+    def is_ready(self):
+        return all(self._table_ready(name) for name in self.tables)
+
+    def build_catalog(self):
+        """(Re)creates the DuckDB views over the Parquet files. Run before opening get_database()."""
+        con = duckdb.connect(self.catalog_path)
+        try:
+            for name in self.tables:
+                con.execute(f"CREATE OR REPLACE VIEW {name} AS SELECT * FROM read_parquet({_sql_path(self.parquet_glob(name))})")
+        finally:
+            con.close()
+
+    def get_engine(self):
+        """Read-only SQLAlchemy engine over the mirror, shared by everything that reads from it."""
+        if self._engine is None:
+            if not self.is_ready():
+                self.sync(full=True)
+            self.build_catalog()
+            self._engine = create_engine(f"duckdb:///{self.catalog_path}", connect_args={"read_only": True})
+        return self._engine
+
+    def get_database(self):
+        """Read-only SQLDatabase over the mirror, for the SQL agents."""
+        return SQLDatabase(self.get_engine(), include_tables=list(self.tables), view_support=True)
+
+    def freshness(self):
+        """Timestamp of the oldest table sync (i.e. everything is at least this fresh)."""
+        stamps = [self.state.get(name, {}).get("synced_at") for name in self.tables]
+        if not all(stamps):
+            return None
+        return datetime.fromisoformat(min(stamps))
+
+    # --- Scheduling ---
+    def start_scheduler(self, interval=ANALYTICS_SYNC_INTERVAL, full_interval=ANALYTICS_FULL_REFRESH_INTERVAL):
+        """Keeps the mirror fresh on a background thread."""
+        if self._scheduler is None:
+            self._scheduler = threading.Thread(target=self._scheduler_loop, args=(interval, full_interval), daemon=True)
+            self._scheduler.start()
+        return self
+
+    def stop_scheduler(self):
+        self._stop.set()
+
+    def _scheduler_loop(self, interval, full_interval):
+        while not self._stop.wait(interval):
+            try:
+                self.sync(full=self._full_refresh_due(full_interval))
+            except Exception as e:
+                print(f"[ANALYTICS] Sync failed: {e}")
+
+    def _full_refresh_due(self, full_interval):
+        stamps = [self.state.get(name, {}).get("full_refresh_at") for name in self.tables]
+        if not all(stamps):
+            return True
+        age = datetime.now(timezone.utc) - datetime.fromisoformat(min(stamps))
+        return age.total_seconds() >= full_interval
+
+    # --- State file ---
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_state(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
@@ -1,7 +1,7 @@
 import streamlit as st
 import os
+import atexit
 import glob
-import docker
 from dotenv import load_dotenv
 from typing import TypedDict, Literal
 
@@ -13,6 +13,10 @@ from langchain_community.agent_toolkits.sql.base import create_sql_agent
 from langchain.tools import tool
 from langgraph.graph import StateGraph, END
 
+from sandbox_pool import SandboxPool, SandboxPoolError
+from analytics_mirror import ANALYTICS_MODE, AnalyticsMirror
+from approx_query import ApproxEngine, format_estimate, format_rebuilt_at
+
 # --- 1. CONFIGURATION & CONSTANTS ---
 st.set_page_config(page_title="Credit Union AI Analyst", page_icon="🏦", layout="centered")
 
@@ -20,7 +24,6 @@ st.set_page_config(page_title="Credit Union AI Analyst", page_icon="🏦", layou
 load_dotenv()
 
 CHART_DIR = "charts"
-DOCKER_CONTAINER_NAME = "sandbox"
 DOCKER_WORKDIR = "/workspace"
 
 # DATABASE SETUP (Agnostic)
@@ -29,6 +32,7 @@ DOCKER_WORKDIR = "/workspace"
 # NOTE: If using PostgreSQL/MySQL, ensure you install the driver (e.g., pip install psycopg2)
 default_db = "sqlite:///credit_union.db"
 DB_URI = os.getenv("DATABASE_URL", default_db)
+# ANALYTICS MODE: set ANALYTICS_MODE=on to answer from a DuckDB/Parquet mirror instead of DB_URI
 
 # Ensure charts directory exists
 os.makedirs(CHART_DIR, exist_ok=True)
@@ -36,24 +40,50 @@ os.makedirs(CHART_DIR, exist_ok=True)
 
 # --- 2. CORE LOGIC (Cached) ---
 @st.cache_resource
-def get_docker_container():
-    """Connects to the running Docker container safely."""
+def get_sandbox_pool():
+    """Starts the pool of Docker sandboxes (sized via SANDBOX_* vars in .env)."""
     try:
-        client = docker.from_env()
-        container = client.containers.get(DOCKER_CONTAINER_NAME)
-        return container
+        pool = SandboxPool(chart_dir=CHART_DIR).start()
+        atexit.register(pool.shutdown)  # Remove our containers when Streamlit exits
+        return pool
     except Exception as e:
-        st.error(f"⚠️ Docker Error: Could not connect to container '{DOCKER_CONTAINER_NAME}'. Is it running?")
+        st.error(f"⚠️ Docker Error: Could not start the sandbox pool ({e}). Is Docker running?")
         st.stop()
 
 
+@st.cache_resource
+def get_analytics_mirror():
+    """Syncs the DuckDB/Parquet mirror of DB_URI and keeps it fresh in the background."""
+    try:
+        mirror = AnalyticsMirror(DB_URI)
+        mirror.sync()
+        return mirror.start_scheduler()
+    except Exception as e:
+        st.error(f"⚠️ Analytics Error: Could not sync the analytics mirror ({e}). Check DATABASE_URL or turn off ANALYTICS_MODE.")
+        st.stop()
+
+
+@st.cache_resource
+def get_approx_engine():
+    """Builds the samples/sketches on a background thread and keeps them fresh there."""
+    # Read from the analytics mirror when it's on, so sampling doesn't load the OLTP database either
+    source = get_analytics_mirror().get_engine() if ANALYTICS_MODE else DB_URI
+    return ApproxEngine(source).start_scheduler()
+
+
+def format_freshness(mirror):
+    as_of = mirror.freshness()
+    return as_of.strftime("%Y-%m-%d %H:%M UTC") if as_of else "not yet synced"
+
+
 @st.cache_resource
 def build_engine():
     """Initializes LLM, DB, and Agents."""
 
     # 1. Setup Resources
-    container = get_docker_container()
-    db = SQLDatabase.from_uri(DB_URI)
+    pool = get_sandbox_pool()
+    get_approx_engine()  # Start building fast-mode samples now, not on the first question
+    db = get_analytics_mirror().get_database() if ANALYTICS_MODE else SQLDatabase.from_uri(DB_URI)
     llm = ChatOpenAI(model="gpt-4o", temperature=0)
     sql_toolkit = SQLDatabaseToolkit(db=db, llm=llm)
 
@@ -62,18 +92,48 @@ def build_engine():
     def python_sandbox_tool(code: str) -> str:
         """Executes Python code in a Docker container for visualization."""
         try:
-            # Execute code inside Docker
-            result = container.exec_run(cmd=["python", "-c", code], workdir=DOCKER_WORKDIR)
-
-            # FIX: Decode the bytes to string
-            output = result.output.decode("utf-8")
+            # Borrow the least-loaded sandbox from the pool and hand it back when done
+            with pool.sandbox() as sandbox:
+                exit_code, output = sandbox.run(code, workdir=DOCKER_WORKDIR)
 
-            if result.exit_code != 0:
+            if exit_code != 0:
                 return f"Execution Error:\n{output}"
             return output if output else "Code executed successfully (no stdout)."
+        except SandboxPoolError as e:
+            return f"Sandbox Busy: {str(e)}"
         except Exception as e:
             return f"System Error: {str(e)}"
 
+    @tool
+    def approximate_aggregate(table: str, column: str, agg: str = "avg", filters: dict = None) -> str:
+        """
+        Fast approximate COUNT/AVG/SUM from stratified samples, with a 95% confidence interval.
+        table: 'loans' or 'accounts'. agg: 'count', 'avg' or 'sum' (column may be '*' for count).
+        filters: optional equality filters on loans.loan_type/status or accounts.account_type,
+        e.g. {"loan_type": "HELOC", "status": "Defaulted"}.
+        """
+        try:
+            engine = get_approx_engine()
+            result = engine.estimate(table, column, agg, filters)
+            label = f"{agg.upper()}({column}) on {table} {filters or ''}".strip()
+            return format_estimate(result, label, format_rebuilt_at(engine))
+        except ValueError as e:
+            return f"Approximation Error: {str(e)}"
+
+    @tool
+    def approximate_distinct_count(table: str, column: str, filters: dict = None) -> str:
+        """
+        Fast approximate COUNT(DISTINCT column) from HyperLogLog sketches, with a 95% confidence interval.
+        Same table/filters rules as 'approximate_aggregate'.
+        """
+        try:
+            engine = get_approx_engine()
+            result = engine.distinct_count(table, column, filters)
+            label = f"COUNT(DISTINCT {column}) on {table} {filters or ''}".strip()
+            return format_estimate(result, label, format_rebuilt_at(engine))
+        except ValueError as e:
+            return f"Approximation Error: {str(e)}"
+
     # 3. Create Agents
     # Agent A: Pure SQL Analyst
     sql_agent = create_sql_agent(
@@ -84,6 +144,24 @@ def build_engine():
         suffix="You are a strict Data Analyst. Answer using text and numbers only. Do not generate code."
     )
 
+    # Agent A2: Fast Analyst (approximate mode)
+    approx_agent = create_sql_agent(
+        llm=llm,
+        toolkit=sql_toolkit,
+        verbose=True,
+        agent_type="openai-tools",
+        extra_tools=[approximate_aggregate, approximate_distinct_count],
+        agent_executor_kwargs={"return_intermediate_steps": True},  # Lets the graph see which tools ran
+        suffix="""
+            You are a Data Analyst in FAST (approximate) mode.
+            1. For counts, averages, sums and distinct counts on loans/accounts, use 'approximate_aggregate'
+               or 'approximate_distinct_count' instead of scanning the tables with SQL.
+            2. Always report the estimate with its 95% confidence interval and say it is approximate.
+            3. Only fall back to SQL when the question filters on columns the approximate tools do not support.
+            Answer using text and numbers only. Do not generate code.
+        """
+    )
+
     # Agent B: Visualizer
     vis_agent = create_sql_agent(
         llm=llm,
@@ -102,20 +180,27 @@ def build_engine():
         """
     )
 
-    return sql_agent, vis_agent
+    return sql_agent, approx_agent, vis_agent
 
 
 # --- 3. GRAPH DEFINITION ---
 class AgentState(TypedDict):
     question: str
+    mode: str
     answer: str
     source: str
 
 
-def create_graph(sql_agent, vis_agent):
+def create_graph(sql_agent, approx_agent, vis_agent):
     """Builds the LangGraph workflow."""
 
     def sql_node(state: AgentState):
+        if state.get("mode") == "approximate":
+            response = approx_agent.invoke(state["question"])
+            # Only label the answer approximate if a sample/sketch tool was actually used
+            approx_tools = {"approximate_aggregate", "approximate_distinct_count"}
+            used_samples = any(action.tool in approx_tools for action, _ in response.get("intermediate_steps", []))
+            return {"answer": response["output"], "source": "approximate" if used_samples else "analyst"}
         response = sql_agent.invoke(state["question"])
         return {"answer": response["output"], "source": "analyst"}
 
@@ -146,13 +231,24 @@ def create_graph(sql_agent, vis_agent):
 
 
 # Initialize System
-sql_agent, vis_agent = build_engine()
-app_graph = create_graph(sql_agent, vis_agent)
+sql_agent, approx_agent, vis_agent = build_engine()
+app_graph = create_graph(sql_agent, approx_agent, vis_agent)
 
 # --- 4. STREAMLIT UI ---
 
 st.title("🏦 Self-Serve Credit Union Analyst")
 
+if ANALYTICS_MODE:
+    st.caption(f"📊 Analytics mode: answers come from a snapshot taken {format_freshness(get_analytics_mirror())}.")
+
+# Query Mode Toggle: fast answers come from samples/sketches, exact ones scan the tables
+query_mode = st.sidebar.radio(
+    "Query mode",
+    ["Exact", "Fast (approximate)"],
+    help="Fast mode answers counts, averages and distinct counts from samples, with 95% confidence intervals."
+)
+mode = "approximate" if query_mode.startswith("Fast") else "exact"
+
 # Initialize Session State
 if "messages" not in st.session_state:
     st.session_state.messages = []
@@ -161,6 +257,10 @@ if "messages" not in st.session_state:
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
+        if message.get("freshness"):
+            st.caption(f"📊 Data as of {message['freshness']}")
+        if message.get("approx_note"):
+            st.caption(message["approx_note"])
         # Display Image if present in history
         if "image_path" in message and message["image_path"]:
             if os.path.exists(message["image_path"]):
@@ -193,7 +293,7 @@ if prompt := st.chat_input("Ask about members, loans, or trends..."):
 
             # Invoke Graph
             try:
-                response = app_graph.invoke({"question": prompt})
+                response = app_graph.invoke({"question": prompt, "mode": mode})
                 answer_text = response.get("answer", "No response generated.")
                 source = response.get("source", "unknown")
             except Exception as e:
@@ -210,6 +310,15 @@ if prompt := st.chat_input("Ask about members, loans, or trends..."):
             # 3. Display Response
             st.markdown(answer_text)
 
+            freshness = format_freshness(get_analytics_mirror()) if ANALYTICS_MODE and source != "error" else None
+            if freshness:
+                st.caption(f"📊 Data as of {freshness}")
+            approx_note = None
+            if source == "approximate":
+                approx_note = (f"⚡ Approximate answer from samples last fully rebuilt "
+                               f"{format_rebuilt_at(get_approx_engine())}. Switch to Exact mode for a full scan.")
+                st.caption(approx_note)
+
             if new_image_path:
                 st.image(new_image_path)
                 file_name = os.path.basename(new_image_path)
@@ -226,5 +335,7 @@ if prompt := st.chat_input("Ask about members, loans, or trends..."):
             st.session_state.messages.append({
                 "role": "assistant",
                 "content": answer_text,
-                "image_path": new_image_path
+                "image_path": new_image_path,
+                "freshness": freshness,
+                "approx_note": approx_note
             })
\ No newline at end of file
@@ -0,0 +1,294 @@
+import hashlib
+import math
+import os
+import random
+import threading
+from datetime import datetime, timezone
+
+from sqlalchemy import create_engine, literal_column, select, sql
+
+# --- 1. CONFIGURATION ---
+# Fast/approximate mode answers from in-memory samples and sketches instead of full table scans.
+APPROX_SAMPLE_SIZE = int(os.getenv("APPROX_SAMPLE_SIZE", "1000"))  # Reservoir size per stratum
+APPROX_REFRESH_INTERVAL = int(os.getenv("APPROX_REFRESH_INTERVAL", "300"))  # Incremental refresh (seconds)
+APPROX_REBUILD_INTERVAL = int(os.getenv("APPROX_REBUILD_INTERVAL", "86400"))  # Full rebuild (catches updates)
+
+# Table -> primary key + the columns we stratify on
+SKETCH_TABLES = {
+    "loans": {"pk": "loan_id", "strata": ["loan_type", "status"]},
+    "accounts": {"pk": "account_id", "strata": ["account_type"]},
+}
+
+Z_95 = 1.96
+AGGREGATES = ("count", "avg", "sum")
+
+
+class HyperLogLog:
+    """Distinct-count sketch: 2^p one-byte registers, ~1.04/sqrt(2^p) relative error."""
+
+    def __init__(self, p=12):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+
+    def add(self, value):
+        h = int.from_bytes(hashlib.blake2b(repr(value).encode("utf-8"), digest_size=8).digest(), "big")
+        index = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        merged = HyperLogLog(self.p)
+        merged.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return merged
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * math.log(self.m / zeros)  # Linear counting for small cardinalities
+        return estimate
+
+    @property
+    def relative_error(self):
+        return 1.04 / math.sqrt(self.m)
+
+
+class Stratum:
+    """One (loan_type, status)-style cell: row count, reservoir sample and per-column sketches."""
+
+    def __init__(self, sample_size):
+        self.sample_size = sample_size
+        self.population = 0
+        self.sample = []
+        self.sketches = {}
+
+    def add(self, row, rng):
+        # Reservoir sampling (Algorithm R): every row seen so far is in the sample with equal probability
+        self.population += 1
+        if len(self.sample) < self.sample_size:
+            self.sample.append(row)
+        else:
+            j = rng.randrange(self.population)
+            if j < self.sample_size:
+                self.sample[j] = row
+
+        for column, value in row.items():
+            if value is not None:
+                self.sketches.setdefault(column, HyperLogLog()).add(value)
+
+
+class ApproxEngine:
+    """
+    Approximate answers for exploratory questions.
+    - Stratified reservoir samples give AVG/SUM with 95% confidence intervals.
+    - HyperLogLog sketches give COUNT(DISTINCT ...) without scanning.
+    - refresh() folds in new rows by primary key; refresh(full=True) rebuilds from scratch.
+      Rows that change stratum (e.g. Active -> Defaulted) only move at the next full rebuild.
+    - source can be a database URI or an existing engine (e.g. the analytics mirror's).
+    """
+
+    def __init__(self, source, sample_size=APPROX_SAMPLE_SIZE, tables=None, seed=None):
+        self.source = create_engine(source) if isinstance(source, str) else source
+        self.sample_size = sample_size
+        self.tables = tables or SKETCH_TABLES
+        self.rng = random.Random(seed)
+
+        self.strata = {name: {} for name in self.tables}
+        self.max_ids = {}
+        self.columns = {}
+        self.refreshed_at = None
+        self.rebuilt_at = None
+        self._lock = threading.Lock()  # Guards strata against concurrent estimates
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._scheduler = None
+
+    # --- Refresh ---
+    def refresh(self, full=False):
+        """Streams new (or, with full=True, all) rows into the samples and sketches."""
+        with self._refresh_lock:
+            self._refresh(full)
+        return self
+
+    @property
+    def ready(self):
+        """False until the first full build has finished."""
+        return self.rebuilt_at is not None
+
+    def _refresh(self, full):
+        for name, spec in self.tables.items():
+            pk = spec["pk"]
+            last_id = None if full else self.max_ids.get(name)
+
+            # Plain table/column constructs: no reflection needed, so this also runs against DuckDB views
+            query = select(literal_column("*")).select_from(sql.table(name)).order_by(sql.column(pk))
+            if last_id is not None:
+                query = query.where(sql.column(pk) > last_id)
+
+            strata = {} if full else self.strata[name]
+            max_id = last_id
+            with self.source.connect() as conn:
+                result = conn.execution_options(stream_results=True).execute(query)
+                columns = set(result.keys())
+                for row in result.mappings():
+                    row = dict(row)
+                    key = tuple(row[col] for col in spec["strata"])
+                    with self._lock:
+                        if key not in strata:
+                            strata[key] = Stratum(self.sample_size)
+                        strata[key].add(row, self.rng)
+                    max_id = row[pk]
+
+            with self._lock:
+                self.strata[name] = strata
+                self.max_ids[name] = max_id
+                self.columns[name] = columns
+
+        self.refreshed_at = datetime.now(timezone.utc)
+        if full or self.rebuilt_at is None:
+            self.rebuilt_at = self.refreshed_at
+
+    def start_scheduler(self, interval=APPROX_REFRESH_INTERVAL, rebuild_interval=APPROX_REBUILD_INTERVAL):
+        """Builds (if needed) and then keeps samples and sketches fresh on a background thread."""
+        if self._scheduler is None:
+            self._scheduler = threading.Thread(target=self._scheduler_loop, args=(interval, rebuild_interval), daemon=True)
+            self._scheduler.start()
+        return self
+
+    def stop_scheduler(self):
+        self._stop.set()
+
+    def _scheduler_loop(self, interval, rebuild_interval):
+        while True:
+            try:
+                age = (datetime.now(timezone.utc) - self.rebuilt_at).total_seconds() if self.rebuilt_at else None
+                self.refresh(full=age is None or age >= rebuild_interval)
+            except Exception as e:
+                print(f"[APPROX] Refresh failed: {e}")
+            if self._stop.wait(interval):
+                break
+
+    # --- Estimates ---
+    def estimate(self, table, column, agg="avg", filters=None):
+        """
+        Estimates COUNT(*), AVG(column) or SUM(column) over rows matching the stratum filters.
+        Returns a dict with the aggregate, the estimate, its 95% confidence interval and the sample size used.
+        """
+        agg = agg.lower()
+        if agg not in AGGREGATES:
+            raise ValueError(f"Unsupported aggregate '{agg}'. Use one of: {', '.join(AGGREGATES)}.")
+
+        with self._lock:
+            strata = self._matching(table, filters)
+            if not (agg == "count" and column == "*"):
+                self._check_column(table, column)
+            population = sum(s.population for s in strata)
+
+            if agg == "count":
+                # Stratum sizes are counted, not sampled: no sampling error, but as stale as the last rebuild
+                return self._result(agg, population, 0.0, population, population)
+
+            # Per-stratum mean and variance of the sampled values
+            cells = []
+            for s in strata:
+                values = [float(r[column]) for r in s.sample if r.get(column) is not None]
+                if not values:
+                    continue
+                n = len(values)
+                mean = sum(values) / n
+                var = sum((v - mean) ** 2 for v in values) / (n - 1) if n > 1 else 0.0
+                fpc = max(0.0, 1 - n / s.population)
+                cells.append((s.population, n, mean, var * fpc / n))
+
+        if not cells:
+            return self._result(agg, None, None, 0, population)
+
+        covered = sum(N for N, _, _, _ in cells)
+        total = sum(N * mean for N, _, mean, _ in cells)
+        total_var = sum(N * N * v for N, _, _, v in cells)
+        sampled = sum(n for _, n, _, _ in cells)
+
+        if agg == "sum":
+            return self._result(agg, total, Z_95 * math.sqrt(total_var), sampled, population)
+        return self._result(agg, total / covered, Z_95 * math.sqrt(total_var) / covered, sampled, population)
+
+    def distinct_count(self, table, column, filters=None):
+        """Estimates COUNT(DISTINCT column) by merging the HyperLogLog sketches of matching strata."""
+        with self._lock:
+            strata = self._matching(table, filters)
+            self._check_column(table, column)
+            population = sum(s.population for s in strata)
+            merged = None
+            for s in strata:
+                sketch = s.sketches.get(column)
+                if sketch is not None:
+                    merged = sketch if merged is None else merged.merge(sketch)
+
+        if merged is None:
+            # Known column, but NULL in every matching row: COUNT(DISTINCT) really is 0
+            return self._result("distinct", 0, 0.0, population, population)
+        value = min(merged.count(), population)
+        return self._result("distinct", value, Z_95 * merged.relative_error * value, population, population)
+
+    def _check_column(self, table, column):
+        known = self.columns.get(table, set())
+        if column not in known:
+            raise ValueError(f"Unknown column '{column}' on '{table}'. Available: {', '.join(sorted(known))}.")
+
+    def _matching(self, table, filters):
+        if not self.ready:
+            raise ValueError("Approximate samples are still being built. Use an exact SQL query for now.")
+        if table not in self.tables:
+            raise ValueError(f"No samples for table '{table}'. Available: {', '.join(self.tables)}.")
+        strata_columns = self.tables[table]["strata"]
+        filters = filters or {}
+        unknown = set(filters) - set(strata_columns)
+        if unknown:
+            raise ValueError(f"Can only filter '{table}' on {', '.join(strata_columns)} in approximate mode "
+                             f"(got {', '.join(sorted(unknown))}). Use an exact SQL query instead.")
+
+        wanted = {strata_columns.index(col): str(value).lower() for col, value in filters.items()}
+        return [s for key, s in self.strata[table].items()
+                if all(str(key[i]).lower() == value for i, value in wanted.items())]
+
+    @staticmethod
+    def _result(agg, value, margin, sampled, population):
+        low = high = None
+        if value is not None and margin is not None:
+            low, high = value - margin, value + margin
+        return {"agg": agg, "estimate": value, "low": low, "high": high,
+                "sampled": sampled, "population": population}
+
+
+def format_rebuilt_at(engine):
+    return engine.rebuilt_at.strftime("%Y-%m-%d %H:%M UTC") if engine.rebuilt_at else "not yet built"
+
+
+def format_estimate(result, label, rebuilt_at=None):
+    """Human readable one-liner the agent can quote back to the user."""
+    stale = ""
+    if rebuilt_at:
+        stale = f" Rows that changed category since the last full rebuild ({rebuilt_at}) are not reflected."
+    value = result["estimate"]
+    if value is None:
+        return f"No non-NULL values for {label} ({result['population']:,} matching rows).{stale}"
+    if result["agg"] == "count":
+        return f"{label}: ≈ {value:,} (tracked row count, no sampling error).{stale}"
+    if result["agg"] == "distinct" and value == 0:
+        return f"{label}: 0 (the column is NULL in all {result['population']:,} matching rows).{stale}"
+    if result["low"] == result["high"]:
+        # Every matching row is in the sample (strata smaller than the reservoir), so this is the real value
+        return (f"{label}: {round(value, 10):,} (exact over the sample: all {result['sampled']:,} "
+                f"matching rows were sampled).{stale}")
+    return (f"{label}: ≈ {_format_number(value)} "
+            f"(95% CI {_format_number(result['low'])} – {_format_number(result['high'])}; "
+            f"sample of {result['sampled']:,} out of {result['population']:,} rows).{stale}")
+
+
+def _format_number(value):
+    """Two decimals for amounts, four significant digits for small values like interest rates."""
+    return f"{value:,.2f}" if abs(value) >= 1 else f"{value:.4g}"
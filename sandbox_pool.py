@@ -0,0 +1,343 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import docker
+
+# --- 1. CONFIGURATION ---
+# All pool settings come from the .env file so prod can size the pool without code changes.
+# SANDBOX_DOCKER_HOSTS is a comma separated list of Docker daemons
+# (e.g. "unix:///var/run/docker.sock,tcp://10.0.0.12:2375"). Empty = local daemon from env.
+SANDBOX_IMAGE = os.getenv("SANDBOX_IMAGE", "tool-sandbox")
+SANDBOX_DOCKER_HOSTS = [h.strip() for h in os.getenv("SANDBOX_DOCKER_HOSTS", "").split(",") if h.strip()]
+SANDBOX_POOL_MIN = int(os.getenv("SANDBOX_POOL_MIN", "2"))
+SANDBOX_POOL_MAX = int(os.getenv("SANDBOX_POOL_MAX", "6"))
+SANDBOX_SLOTS = int(os.getenv("SANDBOX_SLOTS", "2"))  # Concurrent execs per container
+SANDBOX_CPUS = float(os.getenv("SANDBOX_CPUS", "1.0"))
+SANDBOX_MEM_LIMIT = os.getenv("SANDBOX_MEM_LIMIT", "512m")
+SANDBOX_EXEC_TIMEOUT = int(os.getenv("SANDBOX_EXEC_TIMEOUT", "30"))  # Seconds per exec
+SANDBOX_ACQUIRE_TIMEOUT = float(os.getenv("SANDBOX_ACQUIRE_TIMEOUT", "60"))
+SANDBOX_HEALTH_INTERVAL = float(os.getenv("SANDBOX_HEALTH_INTERVAL", "30"))
+SANDBOX_IDLE_TTL = float(os.getenv("SANDBOX_IDLE_TTL", "300"))  # Seconds idle before scaling down
+# Owner of this process's containers. Set SANDBOX_POOL_ID per replica to reclaim its containers
+# across restarts; by default each process is its own owner (hostname + pid).
+HOSTNAME = socket.gethostname()
+SANDBOX_POOL_ID = os.getenv("SANDBOX_POOL_ID") or f"{HOSTNAME}-{os.getpid()}"
+
+POOL_LABEL = "selfserve.sandbox-pool"
+OWNER_LABEL = f"{POOL_LABEL}.owner"
+HOST_LABEL = f"{POOL_LABEL}.host"
+PID_LABEL = f"{POOL_LABEL}.pid"
+TIMEOUT_EXIT_CODE = 124  # Exit code of coreutils `timeout` when the command runs too long
+
+
+def _pid_alive(pid):
+    """True if a local process with this pid exists. Errs on the side of 'alive' where we can't tell."""
+    if os.name != "posix":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+class SandboxPoolError(Exception):
+    """Raised when no sandbox can be acquired from the pool."""
+
+
+class Sandbox:
+    """One running sandbox container plus its bookkeeping."""
+
+    def __init__(self, container, host, slots):
+        self.container = container
+        self.host = host
+        self.slots = slots
+        self.active = 0
+        self.healthy = True
+        self.last_used = time.monotonic()
+
+    @property
+    def name(self):
+        return self.container.name
+
+    def run(self, code, workdir="/workspace", timeout=SANDBOX_EXEC_TIMEOUT):
+        """Runs Python code inside the container. Returns (exit_code, output)."""
+        # exec_run has no timeout of its own, so we let coreutils stop runaway code.
+        # TERM first (exit 124), KILL a few seconds later if it is ignored.
+        # 137 alone is not treated as a timeout: it is also what an OOM kill from mem_limit returns.
+        cmd = ["timeout", "-k", "5", str(timeout), "python", "-c", code]
+        result = self.container.exec_run(cmd=cmd, workdir=workdir)
+        output = result.output.decode("utf-8") if result.output else ""
+        if result.exit_code == TIMEOUT_EXIT_CODE:
+            output += f"\nExecution timed out after {timeout}s."
+        return result.exit_code, output
+
+    def is_alive(self):
+        """Health check: container is running and can still start a Python process."""
+        try:
+            self.container.reload()
+            if self.container.status != "running":
+                return False
+            result = self.container.exec_run(cmd=["timeout", "10", "python", "-c", "pass"])
+            return result.exit_code == 0
+        except Exception:
+            return False
+
+
+class SandboxPool:
+    """
+    Keeps a pool of sandbox containers across one or more Docker hosts.
+    - Dispatch: acquire() hands out the least-loaded healthy sandbox.
+    - Health: maintain() replaces dead containers and is run on a background thread.
+    - Scaling: grows while callers are queued, shrinks back to min_size when idle.
+    """
+
+    def __init__(self, clients=None, image=SANDBOX_IMAGE, min_size=SANDBOX_POOL_MIN,
+                 max_size=SANDBOX_POOL_MAX, slots=SANDBOX_SLOTS, cpus=SANDBOX_CPUS,
+                 mem_limit=SANDBOX_MEM_LIMIT, chart_dir=None, idle_ttl=SANDBOX_IDLE_TTL,
+                 owner=SANDBOX_POOL_ID):
+        if clients is None:
+            clients = [docker.DockerClient(base_url=h) for h in SANDBOX_DOCKER_HOSTS] or [docker.from_env()]
+        self.clients = clients
+        self.image = image
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size)
+        self.slots = max(1, slots)
+        self.cpus = cpus
+        self.mem_limit = mem_limit
+        self.chart_dir = chart_dir
+        self.idle_ttl = idle_ttl
+        self.owner = owner
+
+        self.sandboxes = []
+        self.waiting = 0  # Queue depth: callers blocked in acquire()
+        self._starting = 0
+        self._lock = threading.Condition()
+        self._stop = threading.Event()
+        self._monitor = None
+
+    # --- Lifecycle ---
+    def start(self, health_interval=SANDBOX_HEALTH_INTERVAL):
+        """Spins up min_size sandboxes and starts the health/scaling monitor."""
+        self._reap_orphans()
+        try:
+            for _ in range(self.min_size):
+                self._add_sandbox()
+        except Exception:
+            self.shutdown()  # Don't leak the containers we did manage to start
+            raise
+        if health_interval and self._monitor is None:
+            self._monitor = threading.Thread(target=self._monitor_loop, args=(health_interval,), daemon=True)
+            self._monitor.start()
+        return self
+
+    def shutdown(self):
+        """Stops the monitor and removes every container owned by the pool."""
+        self._stop.set()
+        with self._lock:
+            sandboxes, self.sandboxes = self.sandboxes, []
+            self._lock.notify_all()
+        for sandbox in sandboxes:
+            self._remove_container(sandbox)
+
+    # --- Dispatch ---
+    def acquire(self, timeout=SANDBOX_ACQUIRE_TIMEOUT):
+        """Returns the least-loaded healthy sandbox, scaling up if everyone is busy."""
+        deadline = time.monotonic() + timeout
+        scale_failed = False
+        with self._lock:
+            self.waiting += 1
+            try:
+                while True:
+                    if self._stop.is_set():
+                        raise SandboxPoolError("Sandbox pool is shut down.")
+                    sandbox = self._least_loaded()
+                    if sandbox is not None:
+                        sandbox.active += 1
+                        sandbox.last_used = time.monotonic()
+                        return sandbox
+
+                    # Everyone is busy: grow the pool if we still have room
+                    if not scale_failed and len(self.sandboxes) + self._starting < self.max_size:
+                        self._starting += 1
+                        self._lock.release()
+                        try:
+                            self._add_sandbox()
+                            continue
+                        except Exception as e:
+                            # Host down or image missing: stop scaling in this call and wait on the existing pool
+                            scale_failed = True
+                            print(f"[SANDBOX POOL] Could not start a sandbox: {e}")
+                        finally:
+                            self._lock.acquire()
+                            self._starting -= 1
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise SandboxPoolError(
+                            f"No sandbox available after {timeout}s ({len(self.sandboxes)} running).")
+                    self._lock.wait(remaining)
+            finally:
+                self.waiting -= 1
+
+    def release(self, sandbox, healthy=True):
+        """Returns a sandbox to the pool. Unhealthy sandboxes are replaced by the monitor."""
+        with self._lock:
+            sandbox.active = max(0, sandbox.active - 1)
+            sandbox.last_used = time.monotonic()
+            if not healthy:
+                sandbox.healthy = False
+            self._lock.notify_all()
+
+    @contextmanager
+    def sandbox(self, timeout=SANDBOX_ACQUIRE_TIMEOUT):
+        """Context manager around acquire()/release()."""
+        sandbox = self.acquire(timeout)
+        healthy = True
+        try:
+            yield sandbox
+        except docker.errors.APIError:
+            healthy = False  # The daemon rejected the exec: container is probably gone
+            raise
+        finally:
+            self.release(sandbox, healthy=healthy)
+
+    def _least_loaded(self):
+        candidates = [s for s in self.sandboxes if s.healthy and s.active < s.slots]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda s: (s.active, s.last_used))
+
+    # --- Health checks & scaling ---
+    def maintain(self):
+        """Replaces unhealthy sandboxes and scales the pool with queue depth."""
+        with self._lock:
+            idle = [s for s in self.sandboxes if s.active == 0]
+
+        # Probe idle containers outside the lock; busy ones prove themselves by running code
+        for sandbox in idle:
+            if sandbox.healthy and not sandbox.is_alive():
+                sandbox.healthy = False
+
+        with self._lock:
+            dead = [s for s in self.sandboxes if not s.healthy and s.active == 0]
+            for sandbox in dead:
+                self.sandboxes.remove(sandbox)
+
+            # Scale down: drop sandboxes idle longer than idle_ttl, but never below min_size
+            excess = []
+            if self.waiting == 0:
+                now = time.monotonic()
+                spare = len(self.sandboxes) - self.min_size
+                for sandbox in sorted(self.sandboxes, key=lambda s: s.last_used):
+                    if spare <= 0:
+                        break
+                    if sandbox.active == 0 and now - sandbox.last_used > self.idle_ttl:
+                        self.sandboxes.remove(sandbox)
+                        excess.append(sandbox)
+                        spare -= 1
+
+            # Scale up: refill to min_size, plus one sandbox per queued caller (up to max_size)
+            target = min(self.max_size, max(self.min_size, len(self.sandboxes) + self.waiting))
+            missing = max(0, target - len(self.sandboxes) - self._starting)
+            self._starting += missing  # Reserve the slots so a concurrent acquire() can't overshoot max_size
+
+        for sandbox in dead + excess:
+            self._remove_container(sandbox)
+        for attempt in range(missing):
+            try:
+                self._add_sandbox()
+            except Exception:
+                with self._lock:
+                    self._starting -= missing - attempt  # Release this slot and the ones we won't try
+                break
+            with self._lock:
+                self._starting -= 1
+
+    def stats(self):
+        """Snapshot of the pool for logging / the UI."""
+        with self._lock:
+            return {
+                "size": len(self.sandboxes),
+                "busy": sum(1 for s in self.sandboxes if s.active),
+                "healthy": sum(1 for s in self.sandboxes if s.healthy),
+                "waiting": self.waiting,
+            }
+
+    def _monitor_loop(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.maintain()
+            except Exception as e:
+                print(f"[SANDBOX POOL] Health check failed: {e}")
+
+    # --- Container management ---
+    def _pick_client(self):
+        """Places new containers on the Docker host running the fewest sandboxes."""
+        with self._lock:
+            counts = {id(c): 0 for c in self.clients}
+            for sandbox in self.sandboxes:
+                counts[id(sandbox.host)] = counts.get(id(sandbox.host), 0) + 1
+        return min(self.clients, key=lambda c: counts[id(c)])
+
+    def _add_sandbox(self):
+        client = self._pick_client()
+        volumes = {}
+        if self.chart_dir:
+            # Only the charts folder is shared with the host (remote hosts need a shared volume here)
+            volumes[os.path.abspath(self.chart_dir)] = {"bind": "/workspace/charts", "mode": "rw"}
+
+        container = client.containers.run(
+            self.image,
+            name=f"sandbox-pool-{uuid.uuid4().hex[:8]}",
+            detach=True,
+            labels={POOL_LABEL: "1", OWNER_LABEL: self.owner, HOST_LABEL: HOSTNAME, PID_LABEL: str(os.getpid())},
+            nano_cpus=int(self.cpus * 1e9),
+            mem_limit=self.mem_limit,
+            network_disabled=True,
+            volumes=volumes,
+        )
+        sandbox = Sandbox(container, client, self.slots)
+        with self._lock:
+            self.sandboxes.append(sandbox)
+            self._lock.notify_all()
+        return sandbox
+
+    def _reap_orphans(self):
+        """
+        Removes pool containers left behind by a previous run (e.g. a Streamlit restart).
+        Only touches our own owner id, or containers whose owning process on this machine is gone;
+        other live pools sharing the Docker hosts keep theirs.
+        """
+        for client in self.clients:
+            try:
+                containers = client.containers.list(all=True, filters={"label": POOL_LABEL})
+            except Exception as e:
+                print(f"[SANDBOX POOL] Could not list old sandboxes: {e}")
+                continue
+            for container in containers:
+                if not self._is_orphan(container.labels or {}):
+                    continue
+                try:
+                    container.remove(force=True)
+                except Exception:
+                    pass
+
+    def _is_orphan(self, labels):
+        if labels.get(OWNER_LABEL) == self.owner:
+            return True
+        pid = labels.get(PID_LABEL, "")
+        return labels.get(HOST_LABEL) == HOSTNAME and pid.isdigit() and not _pid_alive(int(pid))
+
+    @staticmethod
+    def _remove_container(sandbox):
+        try:
+            sandbox.container.remove(force=True)
+        except Exception:
+            pass
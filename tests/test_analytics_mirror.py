@@ -0,0 +1,109 @@
+import glob
+import os
+import shutil
+import sqlite3
+
+import duckdb
+import pytest
+from sqlalchemy.exc import NoSuchTableError
+
+from analytics_mirror import AnalyticsMirror
+
+
+def make_source(path):
+    """Tiny copy of the credit union schema (see setup_db.py)."""
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE members (member_id INTEGER PRIMARY KEY, name TEXT, email TEXT, age INTEGER, join_date DATE);
+        CREATE TABLE accounts (account_id INTEGER PRIMARY KEY, member_id INTEGER, account_type TEXT,
+                               balance REAL, open_date DATE);
+        CREATE TABLE loans (loan_id INTEGER PRIMARY KEY, member_id INTEGER, loan_type TEXT,
+                            amount REAL, interest_rate REAL, status TEXT);
+        INSERT INTO members VALUES (1, 'Jane Doe', NULL, 40, '2020-01-01'), (2, 'Bob Smith', '\\N', 30, '2021-06-15');
+        INSERT INTO accounts VALUES (1, 1, 'Checking', 100.0, '2020-01-01'), (2, 2, 'Savings', 250.5, '2021-06-15');
+        INSERT INTO loans VALUES (1, 1, 'Auto', 10000.0, 4.5, 'Active');
+    ''')
+    conn.commit()
+    return conn
+
+
+def count(mirror, table):
+    return duckdb.sql(f"SELECT count(*) FROM read_parquet('{mirror.parquet_glob(table)}')").fetchone()[0]
+
+
+def test_snapshot_sync(tmp_path):
+    """1. Does the first sync copy every table into Parquet with a freshness stamp?"""
+    make_source(tmp_path / "source.db").close()
+    mirror = AnalyticsMirror(f"sqlite:///{tmp_path / 'source.db'}", mirror_dir=str(tmp_path / "mirror"))
+
+    assert mirror.freshness() is None
+    mirror.sync()
+
+    assert mirror.is_ready()
+    assert (count(mirror, "members"), count(mirror, "accounts"), count(mirror, "loans")) == (2, 2, 1)
+    assert mirror.freshness() is not None
+
+    rows = duckdb.sql(f"SELECT email, join_date FROM read_parquet('{mirror.parquet_glob('members')}') "
+                      "ORDER BY member_id").fetchall()
+    assert rows[0][0] is None and str(rows[0][1]) == "2020-01-01"
+    assert rows[1][0] == "\\N"  # A literal backslash-N is data, not NULL
+
+
+def test_incremental_sync_appends_new_rows(tmp_path):
+    """2. Does a later sync only pull rows we haven't mirrored yet?"""
+    conn = make_source(tmp_path / "source.db")
+    mirror = AnalyticsMirror(f"sqlite:///{tmp_path / 'source.db'}", mirror_dir=str(tmp_path / "mirror"))
+    mirror.sync()
+
+    conn.execute("INSERT INTO loans VALUES (2, 2, 'HELOC', 50000.0, 6.1, 'Defaulted')")
+    conn.commit()
+    conn.close()
+    mirror.sync()
+
+    assert count(mirror, "loans") == 2
+    assert len(glob.glob(mirror.parquet_glob("loans"))) == 2  # Snapshot + one part file, nothing rewritten
+    assert mirror.state["loans"]["max_id"] == 2
+    assert mirror.state["loans"]["rows"] == 2
+
+
+def test_full_refresh_picks_up_updates(tmp_path):
+    """3. Does a full snapshot replace rows that changed in place?"""
+    conn = make_source(tmp_path / "source.db")
+    mirror = AnalyticsMirror(f"sqlite:///{tmp_path / 'source.db'}", mirror_dir=str(tmp_path / "mirror"))
+    mirror.sync()
+
+    conn.execute("UPDATE loans SET status = 'Paid Off' WHERE loan_id = 1")
+    conn.commit()
+    conn.close()
+    mirror.sync(full=True)
+
+    status = duckdb.sql(f"SELECT status FROM read_parquet('{mirror.parquet_glob('loans')}')").fetchone()[0]
+    assert status == "Paid Off"
+    assert count(mirror, "loans") == 1
+    assert len(glob.glob(mirror.parquet_glob("loans"))) == 1  # Part files compacted away
+
+
+def test_failed_table_does_not_duplicate_earlier_tables(tmp_path):
+    """4. If one table fails mid-sync, does a restarted mirror avoid re-appending the others?"""
+    conn = make_source(tmp_path / "source.db")
+    uri, mirror_dir = f"sqlite:///{tmp_path / 'source.db'}", str(tmp_path / "mirror")
+    AnalyticsMirror(uri, mirror_dir=mirror_dir).sync()
+
+    conn.execute("INSERT INTO members VALUES (3, 'New Member', NULL, 22, '2024-01-01')")
+    conn.execute("ALTER TABLE loans RENAME TO loans_renamed")
+    conn.commit()
+    with pytest.raises(NoSuchTableError):
+        AnalyticsMirror(uri, mirror_dir=mirror_dir).sync()
+
+    # An orphaned part file (written, state never saved) is dropped rather than double counted
+    orphan = os.path.join(mirror_dir, "members", "part-0.parquet")
+    shutil.copy(os.path.join(mirror_dir, "members", "snapshot.parquet"), orphan)
+
+    conn.execute("ALTER TABLE loans_renamed RENAME TO loans")
+    conn.commit()
+    conn.close()
+    restarted = AnalyticsMirror(uri, mirror_dir=mirror_dir)
+    restarted.sync()
+
+    assert count(restarted, "members") == 3
+    assert not os.path.exists(orphan)
@@ -0,0 +1,125 @@
+import sqlite3
+import time
+
+import pytest
+
+from analytics_mirror import AnalyticsMirror
+from approx_query import ApproxEngine, HyperLogLog, format_estimate, format_rebuilt_at
+
+
+def make_source(path, n_loans=2000):
+    """Loans table shaped like setup_db.py, with predictable amounts per stratum."""
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE loans (loan_id INTEGER PRIMARY KEY, member_id INTEGER, loan_type TEXT,
+                            amount REAL, interest_rate REAL, status TEXT);
+        CREATE TABLE accounts (account_id INTEGER PRIMARY KEY, member_id INTEGER, account_type TEXT,
+                               balance REAL, open_date DATE);
+    ''')
+    for i in range(1, n_loans + 1):
+        loan_type = "HELOC" if i % 2 else "Auto"
+        status = "Defaulted" if i % 5 == 0 else "Active"
+        conn.execute("INSERT INTO loans VALUES (?, ?, ?, ?, ?, ?)",
+                     (i, i % 300, loan_type, float(i % 100) * 1000, 5.0, status))
+    conn.execute("INSERT INTO accounts VALUES (1, 1, 'Checking', 100.0, '2020-01-01')")
+    conn.commit()
+    return conn
+
+
+def test_hyperloglog_distinct_count():
+    """1. Is the sketch within a few percent of the true distinct count?"""
+    sketch = HyperLogLog()
+    for i in range(20000):
+        sketch.add(i % 5000)
+
+    assert abs(sketch.count() - 5000) / 5000 < 0.05
+
+
+def test_stratified_estimates_cover_truth(tmp_path):
+    """2. Do AVG/COUNT estimates land on (or bracket) the exact answer?"""
+    conn = make_source(tmp_path / "source.db")
+    engine = ApproxEngine(f"sqlite:///{tmp_path / 'source.db'}", sample_size=100, seed=7).refresh(full=True)
+
+    filters = {"loan_type": "heloc", "status": "Defaulted"}
+    exact_avg, exact_count = conn.execute(
+        "SELECT AVG(amount), COUNT(*) FROM loans WHERE loan_type = 'HELOC' AND status = 'Defaulted'").fetchone()
+
+    count = engine.estimate("loans", "amount", "count", filters)
+    assert count["estimate"] == exact_count
+
+    avg = engine.estimate("loans", "amount", "avg", filters)
+    assert avg["sampled"] == 100
+    assert avg["low"] <= exact_avg <= avg["high"]
+    assert "95% CI" in format_estimate(avg, "AVG(amount)")
+
+    members = engine.distinct_count("loans", "member_id")
+    assert members["low"] <= 300 <= members["high"]
+
+
+def test_incremental_refresh_and_filter_validation(tmp_path):
+    """3. Do new rows get folded in, and do unsupported filters fail loudly?"""
+    conn = make_source(tmp_path / "source.db", n_loans=10)
+    engine = ApproxEngine(f"sqlite:///{tmp_path / 'source.db'}", sample_size=100).refresh(full=True)
+
+    conn.execute("INSERT INTO loans VALUES (11, 1, 'Mortgage', 250000.0, 3.5, 'Active')")
+    conn.commit()
+    engine.refresh()
+
+    assert engine.estimate("loans", "amount", "count")["estimate"] == 11
+    assert engine.estimate("loans", "amount", "avg", {"loan_type": "Mortgage"})["estimate"] == 250000.0
+
+    with pytest.raises(ValueError, match="loan_type"):
+        engine.estimate("loans", "amount", "avg", {"member_id": 1})
+
+
+def test_background_build_and_count_wording(tmp_path):
+    """4. Are estimates refused until the background build finishes, and never labelled exact?"""
+    make_source(tmp_path / "source.db", n_loans=50).close()
+    engine = ApproxEngine(f"sqlite:///{tmp_path / 'source.db'}", sample_size=10)
+
+    with pytest.raises(ValueError, match="still being built"):
+        engine.estimate("loans", "amount", "count")
+
+    engine.start_scheduler(interval=60)
+    deadline = time.monotonic() + 5
+    while not engine.ready and time.monotonic() < deadline:
+        time.sleep(0.01)
+    engine.stop_scheduler()
+
+    text = format_estimate(engine.estimate("loans", "amount", "count"), "COUNT(*)", format_rebuilt_at(engine))
+    assert "exact" not in text
+    assert "last full rebuild" in text
+
+
+def test_samples_can_come_from_the_analytics_mirror(tmp_path):
+    """5. Can fast-mode samples be built from the mirror instead of the source database?"""
+    make_source(tmp_path / "source.db", n_loans=10).close()
+    mirror = AnalyticsMirror(f"sqlite:///{tmp_path / 'source.db'}", mirror_dir=str(tmp_path / "mirror"),
+                             tables={"loans": "loan_id", "accounts": "account_id"})
+
+    engine = ApproxEngine(mirror.get_engine(), sample_size=100).refresh(full=True)
+
+    assert engine.estimate("loans", "amount", "count")["estimate"] == 10
+    assert engine.estimate("accounts", "balance", "avg")["estimate"] == 100.0
+
+
+def test_small_strata_and_bad_columns(tmp_path):
+    """6. Are fully sampled strata reported as-is (not as a count), and unknown columns rejected?"""
+    conn = make_source(tmp_path / "source.db", n_loans=20)
+    conn.execute("UPDATE loans SET interest_rate = 0.0705")
+    conn.commit()
+    conn.close()
+    engine = ApproxEngine(f"sqlite:///{tmp_path / 'source.db'}", sample_size=1000).refresh(full=True)
+
+    avg = engine.estimate("loans", "interest_rate", "avg")
+    assert avg["agg"] == "avg" and avg["low"] == avg["high"]  # Every row sampled: no margin
+    text = format_estimate(avg, "AVG(interest_rate)")
+    assert "0.0705" in text and "exact over the sample" in text
+    assert "row count" not in text
+
+    assert "20 (tracked row count" in format_estimate(engine.estimate("loans", "*", "count"), "COUNT(*)")
+
+    with pytest.raises(ValueError, match="Unknown column 'member_idx'"):
+        engine.distinct_count("loans", "member_idx")
+    with pytest.raises(ValueError, match="Unknown column"):
+        engine.estimate("loans", "amount_typo", "avg")
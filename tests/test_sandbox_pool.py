@@ -0,0 +1,183 @@
+import os
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from sandbox_pool import HOSTNAME, HOST_LABEL, OWNER_LABEL, PID_LABEL, POOL_LABEL, SandboxPool, SandboxPoolError
+
+
+# Minimal stand-ins for the docker SDK so the pool logic can be tested without a daemon
+class FakeContainer:
+    def __init__(self, name, alive=True, labels=None):
+        self.name = name
+        self.labels = labels or {}
+        self.status = "running" if alive else "exited"
+        self.removed = False
+        self.commands = []
+
+    def exec_run(self, cmd, workdir=None):
+        self.commands.append(cmd)
+        return SimpleNamespace(exit_code=0, output=b"20\n")
+
+    def reload(self):
+        pass
+
+    def remove(self, force=False):
+        self.removed = True
+
+
+class FakeClient:
+    def __init__(self):
+        self.started = []
+        self.containers = self
+
+    def run(self, image, name, **kwargs):
+        container = FakeContainer(name, labels=kwargs.get("labels"))
+        container.kwargs = kwargs
+        self.started.append(container)
+        return container
+
+    def list(self, all=False, filters=None):
+        return [c for c in self.started if not c.removed]
+
+
+class BrokenClient(FakeClient):
+    """Docker host that refuses to start containers (daemon down, image missing...)."""
+
+    def __init__(self):
+        super().__init__()
+        self.attempts = 0
+
+    def run(self, image, name, **kwargs):
+        self.attempts += 1
+        raise RuntimeError("image not found")
+
+
+def make_pool(**kwargs):
+    return SandboxPool(clients=[FakeClient(), FakeClient()], **kwargs).start(health_interval=0)
+
+
+def test_pool_starts_min_size_across_hosts():
+    """1. Does the pool spread its containers across Docker hosts with resource limits?"""
+    pool = make_pool(min_size=2, max_size=4, cpus=0.5, mem_limit="256m")
+
+    assert [len(c.started) for c in pool.clients] == [1, 1]
+    container = pool.clients[0].started[0]
+    assert container.kwargs["nano_cpus"] == 500_000_000
+    assert container.kwargs["mem_limit"] == "256m"
+    assert container.kwargs["network_disabled"] is True
+
+
+def test_least_loaded_dispatch_and_scale_up():
+    """2. Do we hand out the idlest sandbox, then grow the pool when everyone is busy?"""
+    pool = make_pool(min_size=2, max_size=3, slots=1)
+
+    first = pool.acquire()
+    second = pool.acquire()
+    assert first is not second
+
+    third = pool.acquire()  # Pool is saturated, so a new container is started
+    assert pool.stats()["size"] == 3
+
+    with pytest.raises(SandboxPoolError):
+        pool.acquire(timeout=0.05)
+
+    pool.release(third)
+    assert pool.acquire(timeout=0.05) is third
+
+
+def test_run_wraps_code_in_timeout():
+    """3. Is every exec bounded by the per-exec timeout?"""
+    pool = make_pool(min_size=1, max_size=1)
+
+    with pool.sandbox() as sandbox:
+        exit_code, output = sandbox.run("print(10 + 10)", timeout=5)
+
+    assert exit_code == 0 and output.strip() == "20"
+    assert sandbox.container.commands[-1][:4] == ["timeout", "-k", "5", "5"]
+
+
+def test_unhealthy_sandbox_is_replaced():
+    """4. Does maintain() swap out a dead container?"""
+    pool = make_pool(min_size=1, max_size=2)
+    dead = pool.sandboxes[0]
+    dead.container.status = "exited"
+
+    pool.maintain()
+
+    assert dead.container.removed
+    assert pool.stats() == {"size": 1, "busy": 0, "healthy": 1, "waiting": 0}
+    assert pool.sandboxes[0] is not dead
+
+
+def test_failed_scale_up_respects_timeout():
+    """5. If no new container can start, do we give up at the deadline instead of spinning?"""
+    pool = make_pool(min_size=1, max_size=3, slots=1)
+    broken = BrokenClient()
+    pool.clients = [broken]
+    pool.acquire()  # Saturate the only sandbox
+
+    started = time.monotonic()
+    with pytest.raises(SandboxPoolError):
+        pool.acquire(timeout=0.2)
+
+    assert time.monotonic() - started < 1
+    assert broken.attempts == 1
+
+
+def test_start_reaps_orphans_and_cleans_up_partial_failure():
+    """6. Are our own stale containers removed on start (and no one else's), and new ones removed if start fails?"""
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+
+    def labelled(owner, pid):
+        return {POOL_LABEL: "1", OWNER_LABEL: owner, HOST_LABEL: HOSTNAME, PID_LABEL: str(pid)}
+
+    client = FakeClient()
+    ours = client.run("tool-sandbox", "sandbox-pool-ours", labels=labelled("replica-1", os.getpid()))
+    dead_owner = client.run("tool-sandbox", "sandbox-pool-dead", labels=labelled("other", exited.pid))
+    live_owner = client.run("tool-sandbox", "sandbox-pool-live", labels=labelled("other", os.getppid()))
+    SandboxPool(clients=[client], min_size=1, max_size=1, owner="replica-1").start(health_interval=0)
+
+    assert ours.removed and dead_owner.removed
+    assert not live_owner.removed  # Another live pool's sandbox survives
+
+    class FlakyClient(FakeClient):
+        def run(self, image, name, **kwargs):
+            if self.started:
+                raise RuntimeError("daemon went away")
+            return super().run(image, name, **kwargs)
+
+    flaky = FlakyClient()
+    with pytest.raises(RuntimeError):
+        SandboxPool(clients=[flaky], min_size=2, max_size=2).start(health_interval=0)
+    assert all(c.removed for c in flaky.started)
+
+
+def test_maintain_reserves_slots_before_scaling_up():
+    """7. Does maintain() count its in-flight starts so acquire() can't push the pool past max_size?"""
+    pool = make_pool(min_size=1, max_size=2)
+    seen = []
+
+    class WatchingClient(FakeClient):
+        def run(self, image, name, **kwargs):
+            seen.append(len(pool.sandboxes) + pool._starting)
+            return super().run(image, name, **kwargs)
+
+    pool.clients = [WatchingClient()]
+    pool.waiting = 3  # Pretend callers are queued
+    pool.maintain()
+    pool.waiting = 0
+
+    assert seen == [2]  # The slot was already reserved while the container was starting
+    assert pool._starting == 0 and pool.stats()["size"] == 2
+
+    pool.clients = [BrokenClient()]
+    pool.sandboxes.pop()
+    pool.waiting = 3
+    pool.maintain()
+    pool.waiting = 0
+    assert pool._starting == 0  # Reservation is released when the start fails
@@ -5,13 +5,14 @@ import sqlite3
 from dotenv import load_dotenv  # <--- NEW IMPORT
 from langchain_community.utilities import SQLDatabase
 
+from sandbox_pool import SANDBOX_IMAGE, SandboxPool
+
 # Load environment to get the same DB as the App
 load_dotenv()
 
 # CONSTANTS
 # Now the test uses the exact same DB defined in your .env
 DB_URI = os.getenv("DATABASE_URL", "sqlite:///credit_union.db")
-CONTAINER_NAME = "sandbox"
 
 
 def test_database_connection():
@@ -27,30 +28,27 @@ def test_database_connection():
 
 
 def test_docker_infrastructure():
-    """2. Is the Docker Engine running and is our container alive?"""
+    """2. Is the Docker Engine running and is the sandbox image built?"""
     client = docker.from_env()
 
-    # Check if container exists
+    # The pool starts its containers from this image
     try:
-        container = client.containers.get(CONTAINER_NAME)
-    except docker.errors.NotFound:
-        pytest.fail(f"Container '{CONTAINER_NAME}' not found! Did you run the docker run command?")
-
-    # Check if it's actually running
-    assert container.status == "running", f"Container is in state: {container.status}, expected 'running'"
+        client.images.get(SANDBOX_IMAGE)
+    except docker.errors.ImageNotFound:
+        pytest.fail(f"Image '{SANDBOX_IMAGE}' not found! Did you run 'docker build -t {SANDBOX_IMAGE} .'?")
 
 
 def test_docker_execution_logic():
-    """3. Can the Docker container actually run Python code?"""
-    client = docker.from_env()
-    container = client.containers.get(CONTAINER_NAME)
-
-    # Send a simple math calculation
-    code = "print(10 + 10)"
-    result = container.exec_run(cmd=["python", "-c", code], workdir="/workspace")
+    """3. Can a sandbox from the pool actually run Python code?"""
+    pool = SandboxPool(min_size=1, max_size=1).start(health_interval=0)
+    try:
+        # Send a simple math calculation
+        with pool.sandbox() as sandbox:
+            exit_code, output = sandbox.run("print(10 + 10)")
+    finally:
+        pool.shutdown()
 
-    output = result.output.decode("utf-8").strip()
-    exit_code = result.exit_code
+    output = output.strip()
 
     assert exit_code == 0, f"Python script failed with error: {output}"
     assert output == "20", f"Expected '20', got '{output}'"